@@ -1,62 +1,257 @@
 
+import numbers
+import numpy as np
+from scipy import stats
+from scipy.linalg import cho_factor, cho_solve, qr, qr_delete, qr_insert, solve_triangular
 import statsmodels.formula.api as smf
 import pandas as pd
 
-def forward_selection(data, response, significance_level=0.05):
+def _design_matrix(data, response, predictors, dtype=np.float64):
+    """
+    Monta uma única vez a matriz de desenho usada nos ajustes internos, em forma
+    de desvios: y e as preditoras são centrados na média, o que equivale a ter
+    o intercepto no modelo sem precisar guardar (nem fatorar) a sua coluna.
+    Todos os modelos avaliados têm intercepto, então o número de parâmetros é
+    sempre o número de colunas usadas + 1.
+
+    `data` deve conter apenas linhas completas (já filtradas com `dropna`): a
+    média de uma coluna com valor faltante seria NaN e contaminaria a coluna
+    inteira após a centralização.
+
+    Retorna:
+    - y: vetor da variável resposta centrado (ndarray do tipo `dtype`).
+    - X: matriz com as preditoras centradas, uma coluna por preditora.
+    - col_index: dicionário {nome_da_variavel: posição da coluna em X}.
+    """
+    y = data[response].to_numpy(dtype=dtype)
+    X = data[list(predictors)].to_numpy(dtype=dtype)
+    
+    # A centralização só pode ser feita sobre valores finitos
+    bad = [name for name, ok in zip([response] + list(predictors),
+                                    np.isfinite(np.column_stack([y, X])).all(axis=0)) if not ok]
+    if bad:
+        raise ValueError(f"Valores faltantes ou infinitos nas colunas: {bad}")
+    
+    y = y - y.mean()
+    X = X - X.mean(axis=0)
+    col_index = {name: i for i, name in enumerate(predictors)}
+    return y, X, col_index
+
+
+def _fit_formula(data, response, selected_vars):
+    """
+    Ajusta o modelo final via fórmula, para que o objeto retornado preserve os
+    nomes das variáveis e aceite `predict` diretamente sobre o DataFrame.
+    """
+    formula = f"{response} ~ {' + '.join(selected_vars)}" if selected_vars \
+              else f"{response} ~ 1"  # Se nenhuma variável foi selecionada
+    return smf.ols(formula, data=data).fit()
+
+
+def _score_candidates(XT, col_sq, cand_idx, Q, y_resid):
+    """
+    Avalia, de uma vez, a inclusão de cada coluna `cand_idx` da matriz de
+    desenho no modelo cuja fatoração QR tem a base `Q` e cujos resíduos são
+    `y_resid`. `XT` é a matriz de desenho transposta (uma linha por coluna) e
+    `col_sq` as normas ao quadrado de suas colunas, ambas montadas uma única vez.
+
+    Todas as candidatas são residualizadas contra Q numa única multiplicação
+    de matrizes. Retorna, para cada candidata j (com c_j = parte da coluna
+    ortogonal a Q):
+    - num: c_j · y_resid.
+    - den: c_j · c_j.
+    - delta_ssr: queda da SSR ao incluir a coluna (num² / den), ou -inf se a
+      coluna for colinear com o modelo atual.
+    """
+    X_rem = XT[cand_idx].T
+    resid_rem = X_rem - Q @ (Q.T @ X_rem)
+    num = resid_rem.T @ y_resid
+    den = np.einsum('ij,ij->j', resid_rem, resid_rem)
+    
+    valid = den > _collinearity_tol(XT.dtype) * col_sq[cand_idx]
+    delta_ssr = np.full(len(cand_idx), -np.inf)
+    np.divide(num ** 2, den, out=delta_ssr, where=valid)
+    return num, den, delta_ssr
+
+
+def _collinearity_tol(dtype):
+    """
+    Tolerância relativa do teste de colinearidade: uma coluna é tratada como
+    combinação linear das demais quando a parte dela não explicada por elas
+    tem norma ao quadrado menor que `tol` vezes a sua. Em float64 vale 1e-12;
+    em float32 o erro de arredondamento (épsilon ~1.2e-7) já passa disso, e a
+    tolerância acompanha o épsilon do tipo.
+    """
+    return max(1e-12, 100 * np.finfo(dtype).eps)
+
+
+def _independent_columns(G, tol=1e-12):
+    """
+    Índices das colunas linearmente independentes da matriz de desenho, a
+    partir de G = X'X, percorridas na ordem original: uma coluna é mantida se a
+    parte dela não explicada pelas colunas já mantidas for maior que `tol`
+    vezes a sua norma ao quadrado (o mesmo teste de colinearidade usado na
+    avaliação dos candidatos). Colunas nulas e colunas que são combinação
+    linear das anteriores ficam de fora, o que garante que o bloco
+    G[cols, cols] seja positivo definido.
+    """
+    cols = []
+    L = np.zeros((0, 0))
+    for j in range(G.shape[0]):
+        if G[j, j] <= 0:
+            continue
+        l = solve_triangular(L, G[cols, j], lower=True)
+        d = G[j, j] - l @ l
+        if d <= tol * G[j, j]:
+            continue
+        L = np.block([[L, np.zeros((len(cols), 1))],
+                      [l[None, :], np.sqrt(d)[None, None]]])
+        cols.append(j)
+    return cols
+
+
+def _gram_ols(G, b, yy, cols):
+    """
+    Ajuste OLS enxuto para uso dentro dos laços de seleção, a partir das
+    estatísticas suficientes da matriz de desenho completa (G = X'X, b = X'y e
+    yy = y'y): cada ajuste é um Cholesky do bloco de G das colunas `cols`,
+    sem passar pelas n observações.
+
+    Retorna os coeficientes, a soma dos quadrados dos resíduos (SSR) e
+    (X'X)^-1 do submodelo.
+    """
+    cf = cho_factor(G[np.ix_(cols, cols)])
+    beta = cho_solve(cf, b[cols])
+    ssr = yy - beta @ b[cols]
+    XtX_inv = cho_solve(cf, np.eye(len(cols)))
+    return beta, ssr, XtX_inv
+
+
+def _drop_column(beta, ssr, XtX_inv, j):
+    """
+    Atualiza o ajuste OLS (coeficientes, SSR e (X'X)^-1) após remover a coluna
+    `j` do modelo, via complemento de Schur, sem refazer nenhuma fatoração.
+
+    Retorna None se o pivô [(X'X)^-1]_jj não for positivo (perda de precisão
+    numérica); nesse caso o ajuste deve ser refeito com `_gram_ols`.
+    """
+    a_j = XtX_inv[:, j]
+    if not (np.isfinite(a_j[j]) and a_j[j] > 0):
+        return None
+    keep = np.arange(len(beta)) != j
+    beta_new = beta[keep] - a_j[keep] * (beta[j] / a_j[j])
+    ssr_new = ssr + beta[j] ** 2 / a_j[j]
+    XtX_inv_new = XtX_inv[np.ix_(keep, keep)] - np.outer(a_j[keep], a_j[keep]) / a_j[j]
+    return beta_new, ssr_new, XtX_inv_new
+
+
+def _ols_aic(ssr, n, k):
+    """
+    AIC de um modelo OLS com `k` parâmetros (intercepto incluso) a partir da
+    soma dos quadrados dos resíduos, na mesma escala de `RegressionResults.aic`.
+    """
+    llf = -n / 2 * (np.log(2 * np.pi) + np.log(ssr / n) + 1)
+    return -2 * llf + 2 * k
+
+
+def forward_selection(data, response, significance_level=0.05, dtype=np.float64,
+                      screen_top=None):
     """
     data               : DataFrame contendo a variável resposta e todas as candidatas (X).
     response           : string com o nome da variável dependente (y).
     significance_level : valor de corte para p-valor na inclusão de cada variável.
+    dtype              : tipo da matriz usada na avaliação dos candidatos; np.float32
+                         reduz pela metade a memória lida a cada iteração (o modelo
+                         final é sempre ajustado em float64).
+    screen_top         : se informado, a cada iteração só as `screen_top` candidatas de
+                         maior correlação (em módulo) com os resíduos do modelo atual
+                         são avaliadas; na primeira iteração é a correlação marginal
+                         com y. Se None, todas as candidatas são avaliadas; valores
+                         não inteiros ou menores que 1 levantam ValueError.
     
     Retorna:
     - model: o modelo final ajustado (objeto statsmodels RegressionResults).
     - selected_vars: lista das variáveis selecionadas.
     """
 
-    # Separamos as colunas exceto a de resposta
-    remaining_vars = set(data.columns)
-    remaining_vars.remove(response)
+    if screen_top is not None and (not isinstance(screen_top, numbers.Integral)
+                                   or screen_top < 1):
+        raise ValueError(f"screen_top deve ser None ou um inteiro >= 1, recebido {screen_top}")
+
+    # Separamos as colunas exceto a de resposta, na ordem do DataFrame
+    predictors = [c for c in data.columns if c != response]
+    
+    # Usamos apenas as linhas completas (como o smf.ols faria), tanto na seleção
+    # quanto no ajuste do modelo final
+    data = data[[response] + predictors].dropna()
+    
+    # Montamos a matriz de desenho uma única vez; os ajustes abaixo apenas
+    # selecionam colunas dela por posição
+    y, X, _ = _design_matrix(data, response, predictors, dtype)
+    
+    # Candidatas = colunas 0..p-1 de X; a máscara marca as ainda não selecionadas
+    remaining_idx = np.arange(len(predictors))
+    active = np.ones(len(predictors), dtype=bool)
     
-    # Começamos sem nenhuma variável
+    # Colunas de X contíguas na memória e suas normas ao quadrado
+    XT = np.ascontiguousarray(X.T)
+    col_sq = np.einsum('ij,ij->i', XT, XT)
+    n = len(y)
+    
+    # Começamos sem nenhuma variável (só o intercepto, implícito na forma de
+    # desvios): a fatoração QR (econômica) das colunas selecionadas é vazia
     selected_vars = []
+    Q, R = qr(X[:, []], mode='economic')
     
     # Enquanto estiver encontrando variáveis com p-valor significativo, continua
     changed = True
     
-    while changed and len(remaining_vars) > 0:
+    while changed and active.any():
         changed = False
         
+        # Resíduos de y no modelo atual; o modelo com o candidato terá
+        # Q.shape[1] + 2 parâmetros (contando o intercepto)
+        y_resid = y - Q @ (Q.T @ y)
+        ssr = y_resid @ y_resid
+        df_resid = n - Q.shape[1] - 2
+        
         # Para cada variável ainda não selecionada, testamos adicioná-la no modelo
-        pvals = []
-        for candidate in remaining_vars:
-            # Montamos a fórmula, que é "response ~ variaveis_selecionadas + candidato"
-            formula = f"{response} ~ {' + '.join(selected_vars + [candidate])}" if selected_vars \
-                      else f"{response} ~ {candidate}"
-            
-            # Ajustamos o modelo
-            model = smf.ols(formula, data=data).fit()
-            
-            # Coletamos o p-valor do candidato
-            # (o nome do parâmetro no pvalues será igual ao nome da variável candidata 
-            #  ou 'Intercept' quando for o intercepto)
-            pvals.append((candidate, model.pvalues[candidate]))
+        # "response ~ variaveis_selecionadas + candidato" sem reajustá-lo: o
+        # coeficiente do candidato vem da parte dele ortogonal a Q
+        cand_idx = remaining_idx[active]
         
-        # Ordenamos as variáveis candidatas por menor p-valor
-        pvals.sort(key=lambda x: x[1])
+        # Triagem opcional: mantemos só as screen_top candidatas mais
+        # correlacionadas com os resíduos atuais (um único produto matriz-vetor)
+        if screen_top is not None and len(cand_idx) > screen_top:
+            scores = np.zeros(len(cand_idx))
+            np.divide(np.abs(XT[cand_idx] @ y_resid), np.sqrt(col_sq[cand_idx]),
+                      out=scores, where=col_sq[cand_idx] > 0)
+            cand_idx = cand_idx[np.argsort(-scores, kind='stable')[:screen_top]]
         
-        # Pegamos a candidata com menor p-valor
-        best_candidate, best_pval = pvals[0]
+        num, den, delta_ssr = _score_candidates(XT, col_sq, cand_idx, Q, y_resid)
+        
+        # Candidatas colineares com as variáveis já selecionadas não acrescentam nada
+        if np.isneginf(delta_ssr).all():
+            break
+        
+        # O p-valor do candidato é decrescente na queda da SSR: a candidata com
+        # menor p-valor é a de maior queda, e só o p-valor dela é calculado
+        j = int(np.argmax(delta_ssr))
+        best_col = cand_idx[j]
+        sigma2 = (ssr - delta_ssr[j]) / df_resid
+        t_stat = num[j] / np.sqrt(den[j] * sigma2)
+        best_pval = 2 * stats.t.sf(abs(t_stat), df_resid)
         
         # Se o melhor p-valor for menor que o nível de significância, incluímos a variável
         if best_pval < significance_level:
-            selected_vars.append(best_candidate)
-            remaining_vars.remove(best_candidate)
+            selected_vars.append(predictors[best_col])
+            # Atualizamos a fatoração com a nova coluna, sem refatorar do zero
+            Q, R = qr_insert(Q, R, X[:, best_col], Q.shape[1], which='col')
+            active[best_col] = False
             changed = True
     
     # Ao final, ajustamos o modelo definitivo com as variáveis selecionadas
-    formula = f"{response} ~ {' + '.join(selected_vars)}" if selected_vars \
-              else f"{response} ~ 1"  # Se nenhuma variável foi selecionada
-    final_model = smf.ols(formula, data=data).fit()
+    final_model = _fit_formula(data, response, selected_vars)
     
     return final_model, selected_vars
 
@@ -84,40 +279,53 @@ def backward_selection_aic(data, response):
     remaining_vars = list(data.columns)
     remaining_vars.remove(response)
     
-    # 2. Montar a fórmula completa: response ~ var1 + var2 + ...
-    formula = f"{response} ~ {' + '.join(remaining_vars)}"
-    current_model = smf.ols(formula, data=data).fit()
+    # Usamos apenas as linhas completas (como o smf.ols faria), tanto na seleção
+    # quanto no ajuste do modelo final
+    data = data[[response] + remaining_vars].dropna()
     
-    # Critério atual (AIC do modelo cheio)
-    current_aic = current_model.aic
+    # 2. Montar a matriz de desenho completa (var1 + var2 + ..., em desvios da
+    # média, com o intercepto implícito) e suas estatísticas suficientes,
+    # calculadas uma única vez
+    y, X, _ = _design_matrix(data, response, remaining_vars)
+    n = len(y)
+    G, b, yy = X.T @ X, X.T @ y, y @ y
+    
+    # Variáveis constantes ou colineares com as anteriores não podem ser
+    # estimadas junto com elas e ficam de fora da seleção
+    cols = _independent_columns(G)
+    remaining_vars = [remaining_vars[i] for i in cols]
+    beta, ssr, XtX_inv = _gram_ols(G, b, yy, cols)
+    
+    # Critério atual (AIC do modelo cheio, contando o intercepto)
+    current_aic = _ols_aic(ssr, n, len(beta) + 1)
     
     # 3. Loop para tentar remover variáveis que melhorem (reduzam) o AIC
-    while True:
-        aic_values = []
-        removed_candidate = None
+    while remaining_vars:
+        # Testa remover cada variável (uma por vez) sem reajustar o modelo:
+        # retirar a coluna j aumenta a SSR em beta_j² / [(X'X)^-1]_jj
+        ssr_drop = ssr + beta ** 2 / np.diag(XtX_inv)
+        aic_values = _ols_aic(ssr_drop, n, len(remaining_vars))
         
-        # Testa remover cada variável (uma por vez) e calcula novo AIC
-        for var in remaining_vars:
-            vars_minus_one = [x for x in remaining_vars if x != var]
-            formula_test = f"{response} ~ {' + '.join(vars_minus_one)}"
-            
-            model_test = smf.ols(formula_test, data=data).fit()
-            aic_values.append((var, model_test.aic, model_test))
-        
-        # Ordena pelos menores valores de AIC (melhor)
-        aic_values.sort(key=lambda x: x[1])
-        best_candidate, best_aic, best_model = aic_values[0]
+        # Pegamos a remoção com menor AIC (melhor)
+        j = int(np.argmin(aic_values))
+        best_aic = aic_values[j]
         
         # Se o melhor AIC encontrado for menor que o AIC atual, remove a variável
+        # e atualiza o ajuste sem refazê-lo
         if best_aic < current_aic:
-            remaining_vars.remove(best_candidate)
-            current_aic = best_aic
-            current_model = best_model
+            remaining_vars.pop(j)
+            cols.pop(j)
+            fit = _drop_column(beta, ssr, XtX_inv, j)
+            beta, ssr, XtX_inv = fit if fit is not None else _gram_ols(G, b, yy, cols)
+            current_aic = _ols_aic(ssr, n, len(beta) + 1)
         else:
             # Se não melhorou, paramos o loop
             break
     
-    # 4. Retorna o modelo final e as variáveis escolhidas
+    # 4. Ajusta o modelo final via fórmula com as variáveis que permaneceram
+    current_model = _fit_formula(data, response, remaining_vars)
+    
+    # 5. Retorna o modelo final e as variáveis escolhidas
     return current_model, remaining_vars
 
 
@@ -126,7 +334,8 @@ def stepwise_selection_both(data, response,
                             initial_list=None, 
                             threshold_in=0.01, 
                             threshold_out=0.05, 
-                            verbose=True):
+                            verbose=True,
+                            dtype=np.float64):
     """
     Função para realizar Stepwise (both) usando p-valores e baseando-se no AIC.
     O procedimento avalia tanto a inclusão quanto a exclusão de variáveis
@@ -146,6 +355,10 @@ def stepwise_selection_both(data, response,
         p-valor limite para remover uma variável.
     verbose : bool
         Se True, imprime o log das etapas.
+    dtype : numpy dtype
+        Tipo da matriz usada na avaliação dos candidatos. np.float32 reduz pela
+        metade a memória lida a cada iteração; o modelo final é sempre ajustado
+        em float64.
         
     Retorna
     -------
@@ -162,63 +375,92 @@ def stepwise_selection_both(data, response,
         # Fazemos uma cópia para não afetar a lista original
         selected_vars = list(initial_list)
     
-    # Variáveis candidatas = todas exceto a resposta e as que já estão dentro
-    remaining_vars = list(set(data.columns) - set(selected_vars) - {response})
+    # Matriz de desenho montada uma única vez; cada ajuste usa só um subconjunto de colunas
+    predictors = [c for c in data.columns if c != response]
+    
+    # Usamos apenas as linhas completas (como o smf.ols faria), tanto na seleção
+    # quanto no ajuste do modelo final
+    data = data[[response] + predictors].dropna()
+    y, X, col_index = _design_matrix(data, response, predictors, dtype)
+    
+    # Colunas de X contíguas na memória e suas normas ao quadrado
+    XT = np.ascontiguousarray(X.T)
+    col_sq = np.einsum('ij,ij->i', XT, XT)
+    n = len(y)
+    
+    # Variáveis da lista inicial constantes ou colineares com as anteriores não
+    # podem ser estimadas junto com elas: ficam fora do modelo inicial e voltam
+    # a ser candidatas
+    init_cols = [col_index[v] for v in selected_vars]
+    keep = _independent_columns(X[:, init_cols].T @ X[:, init_cols],
+                                _collinearity_tol(dtype))
+    if verbose:
+        for i in sorted(set(range(len(init_cols))) - set(keep)):
+            print(f"Ignorando '{selected_vars[i]}' (constante ou colinear com outras variáveis)")
+    selected_vars = [selected_vars[i] for i in keep]
+    
+    # Variáveis candidatas = todas exceto a resposta e as que já estão dentro,
+    # como colunas 0..p-1 de X e uma máscara das que estão fora do modelo
+    remaining_idx = np.arange(len(predictors))
+    active = np.ones(len(predictors), dtype=bool)
+    active[[col_index[v] for v in selected_vars]] = False
     
-    # Ajustamos um modelo inicial (pode ser intercepto se selected_vars estiver vazio)
-    formula = f"{response} ~ {' + '.join(selected_vars)}" if selected_vars else f"{response} ~ 1"
-    best_model = smf.ols(formula, data=data).fit()
+    # Fatoração QR (econômica) do modelo atual: selected_vars, nessa ordem (o
+    # intercepto fica implícito na forma de desvios). Ela é atualizada a cada
+    # inclusão/remoção e serve para avaliar todos os candidatos.
+    Q, R = qr(X[:, [col_index[v] for v in selected_vars]], mode='economic')
     
-    # AIC do modelo atual
-    best_aic = best_model.aic
+    # AIC do modelo inicial (pode ser só o intercepto se selected_vars estiver vazio)
+    y_resid = y - Q @ (Q.T @ y)
+    best_aic = _ols_aic(y_resid @ y_resid, n, Q.shape[1] + 1)
     improved = True
     
     while improved:
         improved = False
         
-        # =============== PASSO 1: TENTAR INCLUIR ALGUMA VARIÁVEL ===============
-        # Testamos adicionar cada variável que ainda não está no modelo
-        candidates_for_inclusion = []
-        for var in remaining_vars:
-            formula_test = f"{response} ~ {' + '.join(selected_vars + [var])}"
-            model_test = smf.ols(formula_test, data=data).fit()
-            aic_test = model_test.aic
-            pval_test = model_test.pvalues[var]
-            candidates_for_inclusion.append((var, aic_test, pval_test, model_test))
+        # Quantidades do modelo atual, compartilhadas pelos dois passos abaixo
+        # (k é o número de parâmetros, contando o intercepto)
+        k = Q.shape[1] + 1
+        Qty = Q.T @ y
+        y_resid = y - Q @ Qty
+        ssr = y_resid @ y_resid
         
-        # Verificamos a melhor inclusão (menor AIC) dentre as candidatas
-        candidates_for_inclusion.sort(key=lambda x: x[1])  # ordena por AIC (ascendente)
+        # =============== PASSO 1: TENTAR INCLUIR ALGUMA VARIÁVEL ===============
+        # Testamos adicionar cada variável que ainda não está no modelo, sem
+        # reajustá-lo: a parte da coluna ortogonal a Q dá a queda da SSR e a
+        # estatística t do candidato
+        df_in = n - k - 1
+        cand_idx = remaining_idx[active]
+        num, den, delta_ssr = _score_candidates(XT, col_sq, cand_idx, Q, y_resid)
         
-        if candidates_for_inclusion:
-            best_candidate_inclusion, best_aic_inclusion, best_pval_inclusion, best_model_inclusion = candidates_for_inclusion[0]
+        # O AIC com o candidato é decrescente na queda da SSR: a melhor inclusão
+        # (menor AIC) é a de maior queda, e só ela precisa de AIC e p-valor.
+        # Candidatos colineares com o modelo atual (queda -inf) ficam de fora.
+        if not np.isneginf(delta_ssr).all():
+            j_inclusion = int(np.argmax(delta_ssr))
+            best_candidate_inclusion = predictors[cand_idx[j_inclusion]]
+            ssr_test = ssr - delta_ssr[j_inclusion]
+            best_aic_inclusion = _ols_aic(ssr_test, n, k + 1)
+            t_stat = num[j_inclusion] / np.sqrt(den[j_inclusion] * ssr_test / df_in)
+            best_pval_inclusion = 2 * stats.t.sf(abs(t_stat), df_in)
         else:
             best_candidate_inclusion = None
             best_aic_inclusion = float('inf')
             best_pval_inclusion = 1.0
         
         # =============== PASSO 2: TENTAR REMOVER ALGUMA VARIÁVEL ===============
-        # Testamos remover cada variável que já está no modelo
-        candidates_for_removal = []
+        # Testamos remover cada variável que já está no modelo: retirar a coluna j
+        # aumenta a SSR em beta_j² / [(X'X)^-1]_jj, com (X'X)^-1 = R^-1 R^-T
         if selected_vars:
-            for var in selected_vars:
-                vars_minus_one = [x for x in selected_vars if x != var]
-                if len(vars_minus_one) == 0:
-                    # Se removermos a última variável, modelo vira intercepto
-                    formula_test = f"{response} ~ 1"
-                else:
-                    formula_test = f"{response} ~ {' + '.join(vars_minus_one)}"
-                model_test = smf.ols(formula_test, data=data).fit()
-                aic_test = model_test.aic
-                # Para avaliar remoção, olhamos p-valor do var no modelo anterior?
-                # ou com a var removida?
-                # -> Normalmente se checa p-value do var no "modelo atual",
-                #    mas aqui poderemos seguir a lógica: se AIC melhora, remove.
-                
-                candidates_for_removal.append((var, aic_test, model_test))
+            beta = solve_triangular(R, Qty)
+            R_inv = solve_triangular(R, np.eye(k - 1))
+            XtX_inv_diag = np.einsum('ij,ij->i', R_inv, R_inv)
+            aic_removal = _ols_aic(ssr + beta ** 2 / XtX_inv_diag, n, k - 1)
             
-            # Ordenamos por AIC
-            candidates_for_removal.sort(key=lambda x: x[1])  # menor AIC é melhor
-            best_candidate_removal, best_aic_removal, best_model_removal = candidates_for_removal[0]
+            # Menor AIC é melhor
+            j_removal = int(np.argmin(aic_removal))
+            best_candidate_removal = selected_vars[j_removal]
+            best_aic_removal = aic_removal[j_removal]
         else:
             # Se não há variáveis selecionadas, não podemos remover
             best_candidate_removal = None
@@ -237,10 +479,10 @@ def stepwise_selection_both(data, response,
         # Precisamos verificar qual é o p-valor da var no "modelo atual" para remoção.
         # O p-valor dela no "modelo atual" (best_model) deve estar > threshold_out para justificar remoção
         # E verificar se a remoção melhora AIC também.
-        var_pvalues = best_model.pvalues if len(selected_vars) > 0 else {}
         worst_var_pval = 0.0
-        if best_candidate_removal is not None and best_candidate_removal in var_pvalues:
-            worst_var_pval = var_pvalues[best_candidate_removal]
+        if best_candidate_removal is not None:
+            t_stat = beta[j_removal] / np.sqrt(ssr / (n - k) * XtX_inv_diag[j_removal])
+            worst_var_pval = 2 * stats.t.sf(abs(t_stat), n - k)
         do_removal = (
             (best_aic_removal < best_aic) and 
             (worst_var_pval > threshold_out)
@@ -259,8 +501,8 @@ def stepwise_selection_both(data, response,
         if do_inclusion:
             # Faz a inclusão
             selected_vars.append(best_candidate_inclusion)
-            remaining_vars.remove(best_candidate_inclusion)
-            best_model = best_model_inclusion
+            active[cand_idx[j_inclusion]] = False
+            Q, R = qr_insert(Q, R, X[:, cand_idx[j_inclusion]], k - 1, which='col')
             best_aic = best_aic_inclusion
             improved = True
             if verbose:
@@ -268,11 +510,11 @@ def stepwise_selection_both(data, response,
         
         elif do_removal:
             selected_vars.remove(best_candidate_removal)
-            # E recolocamos a var em remaining_vars, se quisermos permitir re-incluir
+            Q, R = qr_delete(Q, R, j_removal, which='col')
+            # E recolocamos a var entre as candidatas, se quisermos permitir re-incluir
             # depends on the stepwise design; R "both" permitiria re-incluir
-            remaining_vars.append(best_candidate_removal)
+            active[col_index[best_candidate_removal]] = True
             
-            best_model = best_model_removal
             best_aic = best_aic_removal
             improved = True
             if verbose:
@@ -284,7 +526,9 @@ def stepwise_selection_both(data, response,
                 print("No further improvement.")
     
     # Construímos o modelo final com as variáveis que ficaram
-    return best_model, selected_vars
+    final_model = _fit_formula(data, response, selected_vars)
+    
+    return final_model, selected_vars
 
 
 import statsmodels.formula.api as smf
@@ -315,36 +559,56 @@ def backward_selection_pvalue(data, response, alpha=0.05, verbose=True):
     remaining_vars = list(data.columns)
     remaining_vars.remove(response)
 
-    # Ajusta o modelo cheio
-    formula = f"{response} ~ {' + '.join(remaining_vars)}"
-    model = smf.ols(formula, data=data).fit()
+    # Usamos apenas as linhas completas (como o smf.ols faria), tanto na seleção
+    # quanto no ajuste do modelo final
+    data = data[[response] + remaining_vars].dropna()
+
+    # Ajusta o modelo cheio a partir das estatísticas suficientes (X'X, X'y, y'y)
+    # da matriz de desenho em desvios da média (intercepto implícito),
+    # calculadas uma única vez
+    y, X, _ = _design_matrix(data, response, remaining_vars)
+    n = len(y)
+    G, b, yy = X.T @ X, X.T @ y, y @ y
+
+    # Variáveis constantes ou colineares com as anteriores não podem ser
+    # estimadas junto com elas e ficam de fora da seleção
+    cols = _independent_columns(G)
+    if verbose:
+        for i in sorted(set(range(len(remaining_vars))) - set(cols)):
+            print(f"Ignorando '{remaining_vars[i]}' (constante ou colinear com outras variáveis)")
+    remaining_vars = [remaining_vars[i] for i in cols]
+    beta, ssr, XtX_inv = _gram_ols(G, b, yy, cols)
 
     # Loop até não haver mais p-valores acima de alpha
-    while True:
-        # pvalores (excluindo o Intercept)
-        pvals = model.pvalues.drop('Intercept', errors='ignore')
+    while remaining_vars:
+        # p-valores das estatísticas t de cada coeficiente (o intercepto não
+        # entra em beta, mas conta nos graus de liberdade), na mesma ordem de
+        # remaining_vars
+        df_resid = n - len(beta) - 1
+        t_stats = beta / np.sqrt(ssr / df_resid * np.diag(XtX_inv))
+        pv = 2 * stats.t.sf(np.abs(t_stats), df_resid)
         
-        # Pegamos o p-valor mais alto
-        worst_feature = pvals.idxmax()   # nome da variável com maior p-valor
-        worst_pval = pvals.max()
+        # Pegamos o p-valor mais alto, por posição
+        j = int(pv.argmax())
+        worst_pval = pv[j]
         
         if worst_pval > alpha:
             # Remove a variável com maior p-valor
+            worst_feature = remaining_vars.pop(j)
             if verbose:
                 print(f"Removendo '{worst_feature}' (p-value = {worst_pval:.4f})")
-            remaining_vars.remove(worst_feature)
-
-            # Reajusta o modelo
-            if remaining_vars:
-                formula = f"{response} ~ {' + '.join(remaining_vars)}"
-            else:
-                # se não sobrou nenhuma variável, fica só o intercepto
-                formula = f"{response} ~ 1"
 
-            model = smf.ols(formula, data=data).fit()
+            # Atualiza o ajuste sem a coluna removida; se não sobrou nenhuma
+            # variável, fica só o intercepto
+            cols.pop(j)
+            fit = _drop_column(beta, ssr, XtX_inv, j)
+            beta, ssr, XtX_inv = fit if fit is not None else _gram_ols(G, b, yy, cols)
         else:
             # Se não há p-valor acima de alpha, paramos
             break
 
+    # Ajusta o modelo final via fórmula com as variáveis remanescentes
+    model = _fit_formula(data, response, remaining_vars)
+
     # Retorna o modelo final e a lista de variáveis que permaneceram
     return model, remaining_vars